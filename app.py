@@ -6,9 +6,12 @@ import edge_tts
 from pydub import AudioSegment
 import google.generativeai as genai
 from dotenv import load_dotenv
-from PIL import Image
 import io
 import tempfile
+import threading
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import database
 
@@ -38,9 +41,10 @@ speed_str = f"{speed_adjustment:+d}%"
 
 # Import logic from logic.py
 from logic import (
-    process_vocabulary, process_passage, save_audio_file, generate_speech_bytes, 
-    split_into_sentences, clean_text_for_reading, extract_text_from_image, 
-    process_audio_generation, analyze_transcript, generate_conversation_audio
+    process_audio_generation, process_passage_stream, save_audio_file,
+    split_into_sentences, clean_text_for_reading, extract_text_from_image, prepare_image_for_extraction,
+    analyze_transcript, generate_conversation_audio,
+    synthesize_to_cache, prune_preview_cache, join_audio_segments, export_speech_mp3, TTS_CONCURRENCY, GEMINI_MODEL, GEMINI_MAX_CONCURRENCY
 )
 
 # Import Qwen Logic (Lazy load or try/except to avoid crash if not installed)
@@ -51,25 +55,142 @@ except ImportError:
 
 
 
+@st.cache_resource
+def get_gemini_model(api_key):
+    """Returns a Gemini model handle kept warm across reruns (one per API key)."""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(GEMINI_MODEL)
+
 # Wrap extract_text_from_image with cache for Streamlit
 @st.cache_data(show_spinner=False)
-def cached_extract_text_from_image(image_bytes):
-    return extract_text_from_image(image_bytes)
+def cached_extract_text_from_image(image_bytes, mime_type, _model):
+    return extract_text_from_image(image_bytes, mime_type, model=_model)
+
+def extract_uploaded_image(uploaded_file, model):
+    """Downscales an uploaded photo, then extracts its text (cached on the downscaled bytes)."""
+    payload, mime_type = prepare_image_for_extraction(uploaded_file.getvalue(), uploaded_file.type)
+    return cached_extract_text_from_image(payload, mime_type, model)
+
+@st.cache_resource
+def get_background_loop():
+    """Returns an event loop running on a daemon thread, shared by all reruns and sessions."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="tts-event-loop", daemon=True).start()
+    return loop
+
+def submit_async(coro):
+    """Schedules a coroutine on the shared background loop; returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+
+def run_async(coro):
+    """Runs a coroutine on the shared background loop and blocks until it completes."""
+    return submit_async(coro).result()
+
+@st.cache_resource
+def get_audio_bytes_cache():
+    """Latest bytes of each audio file, keyed by path and shared by every session."""
+    return {}, threading.Lock()
+
+def read_audio_bytes(path):
+    """Returns the bytes of an audio file, re-reading it only after it changes on disk."""
+    mtime_ns = os.stat(path).st_mtime_ns
+    cache, lock = get_audio_bytes_cache()
+    with lock:
+        entry = cache.get(path)
+    if entry is not None and entry[0] == mtime_ns:
+        return entry[1]
+
+    with open(path, "rb") as f:
+        data = f.read()
+    with lock:
+        # One entry per path: a regenerated file replaces its old bytes, and deleted files are dropped
+        for stale in [p for p in cache if p != path and not os.path.exists(p)]:
+            del cache[stale]
+        cache[path] = (mtime_ns, data)
+    return data
+
+def iter_async(agen):
+    """Iterates an async generator on the shared background loop from the script thread."""
+    try:
+        while True:
+            try:
+                yield run_async(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_async(agen.aclose())
 
 async def generate_preview_audio(text, rate, voice, provider):
     """Generates a single preview audio file for a word or sentence."""
     if not text:
         return None
     try:
-        mp3_bytes = await generate_speech_bytes(text, rate, voice=voice, provider=provider)
-        # We need a file path for st.audio
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f:
-            f.write(mp3_bytes)
-            return f.name
+        # Previews are content-addressed on disk, so they survive restarts and voice switches
+        return await synthesize_to_cache(text, rate, voice=voice, provider=provider)
     except Exception as e:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Preview generation failed: {e}")
         return None
 
+async def generate_preview_batch(texts, rate, voice, provider):
+    """Generates preview audio files for several texts concurrently. Returns paths in input order."""
+    sem = asyncio.Semaphore(TTS_CONCURRENCY)
+
+    async def generate_one(text):
+        async with sem:
+            return await generate_preview_audio(text, rate, voice, provider)
+
+    return await asyncio.gather(*(generate_one(text) for text in texts))
+
+# Most preview entries kept in session state; older ones are dropped least-recently-used first
+PREVIEW_KEYS_MAX = 200
+
+def make_preview_key(prefix, index, text, rate, voice, provider):
+    """Short fixed-length session key for a preview; hashing the full text avoids truncation collisions."""
+    digest = hashlib.sha1(f"{text}|{rate}|{voice}|{provider}".encode("utf-8")).hexdigest()[:16]
+    return f"{prefix}_{index}_{digest}"
+
+def get_preview_cache():
+    """The session's preview_key -> path map, ordered from least to most recently used."""
+    cache = st.session_state.get("preview_cache")
+    if not isinstance(cache, OrderedDict):
+        cache = OrderedDict(cache or {})
+        st.session_state["preview_cache"] = cache
+    return cache
+
+def lookup_preview(preview_key):
+    """Returns the cached preview path for preview_key (marking it recently used), or None."""
+    cache = get_preview_cache()
+    path = cache.get(preview_key)
+    if path and os.path.exists(path):
+        cache.move_to_end(preview_key)
+        return path
+    return None
+
+def fill_preview_cache(pending, rate, voice, provider):
+    """
+    Synthesizes all missing previews for this render pass in one concurrent batch.
+    pending: list of (preview_key, text) tuples not yet in the preview cache.
+    """
+    if not pending:
+        return
+    cache = get_preview_cache()
+    try:
+        paths = run_async(generate_preview_batch([text for _, text in pending], rate, voice, provider))
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Failed to generate previews: {e}")
+        st.caption(f"⚠️ Preview error: {e}")
+        return
+    for (preview_key, text), path in zip(pending, paths):
+        if path:
+            cache[preview_key] = path
+            cache.move_to_end(preview_key)
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Preview generated: {text[:20]}")
+    # Only the session entries are evicted; the files belong to the shared on-disk cache,
+    # which prune_preview_cache keeps bounded.
+    while len(cache) > PREVIEW_KEYS_MAX:
+        cache.popitem(last=False)
+    prune_preview_cache()
+
 # --- Main UI ---
 
 st.title("Dictation Buddy 🎧")
@@ -102,7 +223,7 @@ with tab3:
             st.warning("Please enter some text.")
         else:
             with st.spinner("Analyzing speakers..."):
-                segments = analyze_transcript(transcript_text, num_speakers, lang_code)
+                segments = analyze_transcript(transcript_text, num_speakers, lang_code, model=get_gemini_model(api_key))
                 st.session_state["conv_segments"] = segments
                 st.session_state["conv_lang"] = lang_code # Store for generation
     
@@ -128,14 +249,7 @@ with tab3:
         if st.button("Generate Conversation Audio", type="primary"):
             with st.spinner("Synthesizing conversation..."):
                 try:
-                    # Async handling
-                    try:
-                        loop = asyncio.get_event_loop()
-                    except RuntimeError:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                    
-                    final_audio_path = loop.run_until_complete(generate_conversation_audio(updated_segments, lang_code, conv_provider_code))
+                    final_audio_path = run_async(generate_conversation_audio(updated_segments, lang_code, conv_provider_code))
                     
                     if final_audio_path:
                         st.session_state["conv_audio_path"] = final_audio_path
@@ -147,9 +261,9 @@ with tab3:
                      st.error(f"Error: {e}")
 
         if st.session_state.get("conv_audio_path"):
-            st.audio(st.session_state["conv_audio_path"], format="audio/mp3")
-            with open(st.session_state["conv_audio_path"], "rb") as f:
-                st.download_button("Download Conversation", f, file_name="conversation.mp3")
+            audio_bytes = read_audio_bytes(st.session_state["conv_audio_path"])
+            st.audio(audio_bytes, format="audio/mp3")
+            st.download_button("Download Conversation", audio_bytes, file_name="conversation.mp3")
 
 
 with tab1:
@@ -199,11 +313,16 @@ with tab1:
                 
                 with st.spinner("Analyzing images with Gemini..."):
                     progress_bar = st.progress(0)
+
+                    # Send images to Gemini a few at a time; results keep upload order
+                    with ThreadPoolExecutor(max_workers=min(len(uploaded_files), GEMINI_MAX_CONCURRENCY)) as executor:
+                        gemini_model = get_gemini_model(api_key)
+                        futures = [executor.submit(extract_uploaded_image, f, gemini_model) for f in uploaded_files]
+                        for done, _ in enumerate(as_completed(futures), start=1):
+                            progress_bar.progress(done / len(futures))
                     
-                    for idx, uploaded_file in enumerate(uploaded_files):
-                        # Read file buffer as bytes for caching key
-                        image_bytes = uploaded_file.getvalue()
-                        data = cached_extract_text_from_image(image_bytes)
+                    for idx, future in enumerate(futures):
+                        data = future.result()
                         
                         if data:
                             print(f"[{datetime.now().strftime('%H:%M:%S')}] Image {idx+1} processed.")
@@ -223,8 +342,6 @@ with tab1:
                                 detected_language = data.get("language", "en")
                         else:
                             print(f"[{datetime.now().strftime('%H:%M:%S')}] Failed to detect dictation content in image {idx+1}.")
-                        
-                        progress_bar.progress((idx + 1) / len(uploaded_files))
 
                 # Combine results
                 final_data = {
@@ -236,7 +353,7 @@ with tab1:
                 st.session_state["extracted_data"] = final_data
                 st.session_state["last_uploaded_files"] = current_files_key
                 # Clear preview cache on new file set
-                st.session_state["preview_cache"] = {}
+                st.session_state["preview_cache"] = OrderedDict()
                 
                 st.success("Analysis Complete!")
         
@@ -315,36 +432,29 @@ with tab1:
 
             # Display list with previews
             updated_vocab_list = []
+            preview_slots = []
             for i, word in enumerate(st.session_state["vocab_list"]):
                 c1, c2 = st.columns([3, 1])
                 with c1:
                     new_word = st.text_input(f"Word {i+1}", value=word, key=f"vocab_{i}")
                     updated_vocab_list.append(new_word)
-                with c2:
-                    # Preview Button
-                    preview_key = f"vocab_preview_{i}_{new_word}_{speed_str}_{selected_voice}_{provider_code}"
-                    cached_path = st.session_state.get("preview_cache", {}).get(preview_key)
-                    
-                    if not cached_path or not os.path.exists(cached_path):
-                         # Generate preview on the fly
-                         try:
-                            # Use asyncio.run for safer loop management
-                            path = asyncio.run(generate_preview_audio(new_word, speed_str, selected_voice, provider_code))
-                            
-                            if path:
-                                if "preview_cache" not in st.session_state:
-                                    st.session_state["preview_cache"] = {}
-                                st.session_state["preview_cache"][preview_key] = path
-                                print(f"[{datetime.now().strftime('%H:%M:%S')}] Preview generated for word: {new_word}")
-                                cached_path = path
-                            else:
-                                st.caption("No audio generated.")
-                         except Exception as e:
-                             print(f"[{datetime.now().strftime('%H:%M:%S')}] Failed to generate preview for word {new_word}: {e}")
-                             st.caption(f"⚠️ Preview error: {e}")
+                preview_key = make_preview_key("vocab_preview", i, new_word, speed_str, selected_voice, provider_code)
+                preview_slots.append((c2, preview_key, new_word))
 
+            # Generate all missing previews in one concurrent batch
+            pending = [
+                (preview_key, text) for _, preview_key, text in preview_slots
+                if text and not lookup_preview(preview_key)
+            ]
+            fill_preview_cache(pending, speed_str, selected_voice, provider_code)
+
+            for c2, preview_key, text in preview_slots:
+                with c2:
+                    cached_path = lookup_preview(preview_key)
                     if cached_path:
                         st.audio(cached_path, format="audio/mp3")
+                    elif text:
+                        st.caption("No audio generated.")
 
             st.session_state["vocab_list"] = updated_vocab_list
             vocab_list = [w for w in updated_vocab_list if w.strip()]
@@ -374,58 +484,66 @@ with tab1:
             passage_speed_adj = st.slider("Passage Speed Adjustment (%)", min_value=-50, max_value=50, value=-20, step=10, key="passage_speed")
             passage_speed_str = f"{passage_speed_adj:+d}%"
 
-            # Always define sentences so save flow can use it
-            sentences = split_into_sentences(passage_text) if passage_text else []
+            # Always define sentences so save flow can use it.
+            # The split is kept in session state and reused for previews, generation and saving.
+            split_cache = st.session_state.get("split_sentences")
+            if split_cache and split_cache[0] == passage_text:
+                sentences = split_cache[1]
+            else:
+                sentences = split_into_sentences(passage_text) if passage_text else []
+                st.session_state["split_sentences"] = (passage_text, sentences)
 
             # Passage Previews
             if sentences:
                 st.markdown("**Sentence Previews**")
 
+                preview_slots = []
                 for i, sentence in enumerate(sentences):
                     c1, c2 = st.columns([3, 1])
                     with c1:
                         st.caption(f"{i+1}. {sentence}")
+                    preview_key = make_preview_key("passage_preview", i, sentence, passage_speed_str, selected_voice, provider_code)
+                    preview_slots.append((c2, preview_key, sentence))
+
+                # Generate all missing previews in one concurrent batch
+                pending = [
+                    (preview_key, clean_text_for_reading(sentence, language=detected_lang))
+                    for _, preview_key, sentence in preview_slots
+                    if not lookup_preview(preview_key)
+                ]
+                fill_preview_cache(pending, passage_speed_str, selected_voice, provider_code)
+
+                for c2, preview_key, _ in preview_slots:
                     with c2:
-                         preview_key = f"passage_preview_{i}_{sentence[:20]}_{passage_speed_str}_{selected_voice}_{provider_code}"
-                         cached_path = st.session_state.get("preview_cache", {}).get(preview_key)
-                         
-                         if not cached_path or not os.path.exists(cached_path):
-                             try:
-                                spoken_sentence = clean_text_for_reading(sentence, language=detected_lang)
-                                path = asyncio.run(generate_preview_audio(spoken_sentence, passage_speed_str, selected_voice, provider_code))
-                                
-                                if path:
-                                    if "preview_cache" not in st.session_state:
-                                        st.session_state["preview_cache"] = {}
-                                    st.session_state["preview_cache"][preview_key] = path
-                                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Sentence preview generated: {sentence[:20]}...")
-                                    cached_path = path
-                                else:
-                                     st.caption("No audio.")
-                             except Exception as e:
-                                 print(f"[{datetime.now().strftime('%H:%M:%S')}] Failed to generate preview for sentence {i}: {e}")
-                                 st.caption(f"⚠️ Error: {e}")
-                         
-                         if cached_path:
+                        cached_path = lookup_preview(preview_key)
+                        if cached_path:
                             st.audio(cached_path, format="audio/mp3")
+                        else:
+                            st.caption("No audio.")
 
         st.divider()
         
         if st.button("Generate Audio 🎵", type="primary"):
             # Run async audio generation
             try:
-                # Handle async loop for Streamlit
-                try:
-                    loop = asyncio.get_event_loop()
-                except RuntimeError:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                
                 with st.spinner("Generating Audio..."):
-                    if loop.is_running():
-                        vocab_path, passage_path = loop.run_until_complete(process_audio_generation(vocab_list, passage_text, speed_str, passage_speed_str, vocab_repeats, vocab_silence, passage_repeats, passage_sentence_pause, passage_repeat_pause, shuffle_vocab, detected_lang, selected_voice, provider_code))
-                    else:
-                         vocab_path, passage_path = loop.run_until_complete(process_audio_generation(vocab_list, passage_text, speed_str, passage_speed_str, vocab_repeats, vocab_silence, passage_repeats, passage_sentence_pause, passage_repeat_pause, shuffle_vocab, detected_lang, selected_voice, provider_code))
+                    # Both files are built in the background; clips the passage stream below is
+                    # already synthesizing are shared with it rather than requested twice
+                    generation = submit_async(process_audio_generation(vocab_list, sentences, speed_str, passage_speed_str, vocab_repeats, vocab_silence, passage_repeats, passage_sentence_pause, passage_repeat_pause, shuffle_vocab, detected_lang, selected_voice, provider_code))
+
+                    if passage_text:
+                        # Play the passage as it is synthesized, sentence by sentence
+                        st.markdown("**Passage (updating as sentences finish)**")
+                        passage_player = st.empty()
+                        passage_progress = st.progress(0)
+                        streamed_audio = bytearray()
+                        passage_stream = process_passage_stream(sentences, passage_speed_str, sentence_repeats=passage_repeats, language=detected_lang, voice=selected_voice, provider=provider_code, sentence_pause_sec=passage_sentence_pause, repeat_pause_sec=passage_repeat_pause)
+                        for idx, block in iter_async(passage_stream):
+                            streamed_audio += block
+                            passage_player.audio(bytes(streamed_audio), format="audio/mp3")
+                            passage_progress.progress((idx + 1) / len(sentences))
+
+                    vocab_path, passage_path = generation.result()
 
                 st.session_state["generated_vocab_path"] = vocab_path
                 st.session_state["generated_passage_path"] = passage_path
@@ -441,15 +559,15 @@ with tab1:
             
             if st.session_state.get("generated_vocab_path"):
                 st.markdown("### Part A: Vocabulary Practice")
-                st.audio(st.session_state["generated_vocab_path"], format="audio/mp3")
-                with open(st.session_state["generated_vocab_path"], "rb") as f:
-                     st.download_button("Download Vocab Audio", f, file_name="vocab_practice.mp3")
+                audio_bytes = read_audio_bytes(st.session_state["generated_vocab_path"])
+                st.audio(audio_bytes, format="audio/mp3")
+                st.download_button("Download Vocab Audio", audio_bytes, file_name="vocab_practice.mp3")
 
             if st.session_state.get("generated_passage_path"):
                 st.markdown("### Part B: Passage Reading")
-                st.audio(st.session_state["generated_passage_path"], format="audio/mp3")
-                with open(st.session_state["generated_passage_path"], "rb") as f:
-                    st.download_button("Download Passage Audio", f, file_name="passage_reading.mp3")
+                audio_bytes = read_audio_bytes(st.session_state["generated_passage_path"])
+                st.audio(audio_bytes, format="audio/mp3")
+                st.download_button("Download Passage Audio", audio_bytes, file_name="passage_reading.mp3")
             
             st.divider()
             st.subheader("Save to Library")
@@ -570,9 +688,9 @@ with tab2:
                     st.subheader("Vocabulary")
                     st.write(", ".join(vocab_list))
                     if session["vocab_audio_path"] and os.path.exists(session["vocab_audio_path"]):
-                        st.audio(session["vocab_audio_path"], format="audio/mp3")
-                        with open(session["vocab_audio_path"], "rb") as f:
-                            st.download_button(f"Download Vocab Audio", f, file_name=f"{session_name}_vocab.mp3", key=f"dl_vocab_{session_id}")
+                        audio_bytes = read_audio_bytes(session["vocab_audio_path"])
+                        st.audio(audio_bytes, format="audio/mp3")
+                        st.download_button(f"Download Vocab Audio", audio_bytes, file_name=f"{session_name}_vocab.mp3", key=f"dl_vocab_{session_id}")
                     elif session["vocab_audio_path"]:
                         st.warning(f"Audio file missing: {os.path.basename(session['vocab_audio_path'])}")
 
@@ -583,9 +701,9 @@ with tab2:
                         st.write(f"{i+1}. {sentence}")
                     
                     if session["passage_audio_path"] and os.path.exists(session["passage_audio_path"]):
-                        st.audio(session["passage_audio_path"], format="audio/mp3")
-                        with open(session["passage_audio_path"], "rb") as f:
-                            st.download_button(f"Download Passage Audio", f, file_name=f"{session_name}_passage.mp3", key=f"dl_passage_{session_id}")
+                        audio_bytes = read_audio_bytes(session["passage_audio_path"])
+                        st.audio(audio_bytes, format="audio/mp3")
+                        st.download_button(f"Download Passage Audio", audio_bytes, file_name=f"{session_name}_passage.mp3", key=f"dl_passage_{session_id}")
                     elif session["passage_audio_path"]:
                         st.warning(f"Audio file missing: {os.path.basename(session['passage_audio_path'])}")
 
@@ -717,7 +835,7 @@ with tab4:
             if st.button("Run (Ctrl + Enter)", type="primary"):
                 # Generation Logic
                 with st.spinner("Generating Speech..."):
-                    combined_audio = AudioSegment.empty()
+                    parts = []
                     
                     for idx, item in enumerate(st.session_state["qwen_script"]):
                         text = item["text"]
@@ -732,19 +850,24 @@ with tab4:
                         if audio_result:
                             # Convert bytes -> AudioSegment
                             seg = AudioSegment.from_file(io.BytesIO(audio_result), format="mp3")
-                            combined_audio += seg
+                            parts.append(seg)
                             # Add small pause
-                            combined_audio += AudioSegment.silent(duration=300)
+                            parts.append(AudioSegment.silent(duration=300))
                         else:
                             st.error(f"Failed to generate line {idx+1}")
                     
                     # Export final
+                    combined_audio = join_audio_segments(parts)
+                    # Each run writes a new temp file, so remove the previous one rather than keep it around
+                    previous_audio = st.session_state.get("qwen_final_audio")
+                    if previous_audio and os.path.exists(previous_audio):
+                        os.remove(previous_audio)
                     with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f:
-                        combined_audio.export(f.name, format="mp3")
+                        export_speech_mp3(combined_audio, f.name)
                         st.session_state["qwen_final_audio"] = f.name
                         st.success("Generation Complete!")
             
             if st.session_state.get("qwen_final_audio"):
-                st.audio(st.session_state["qwen_final_audio"], format="audio/mp3")
-                with open(st.session_state["qwen_final_audio"], "rb") as f:
-                     st.download_button("Download Script Audio", f, file_name="qwen_script_audio.mp3")
+                audio_bytes = read_audio_bytes(st.session_state["qwen_final_audio"])
+                st.audio(audio_bytes, format="audio/mp3")
+                st.download_button("Download Script Audio", audio_bytes, file_name="qwen_script_audio.mp3")
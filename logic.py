@@ -1,18 +1,134 @@
 import os
+import atexit
 import re
+import hashlib
 import tempfile
 import io
 import asyncio
-import edge_tts
-from pydub import AudioSegment
 import random
 import shutil
+import functools
+import subprocess
+import time
+from collections import OrderedDict
 from datetime import datetime
 
-import requests
 import base64
 import json
 
+try:
+    import orjson  # Optional: faster JSON for the base64-heavy Google TTS payloads
+except ImportError:
+    orjson = None
+
+# Maximum number of TTS requests issued concurrently per generation job
+TTS_CONCURRENCY = 8
+
+# On-disk cache of synthesized clips, keyed by (provider, voice, rate, text)
+PREVIEW_CACHE_DIR = os.path.join("cache", "previews")
+PREVIEW_CACHE_MAX_FILES = 500
+# Hot clips kept in memory as bytes, so repeats skip even the disk lookup
+SPEECH_MEMORY_CACHE_MAX = 64
+_speech_memory_cache = OrderedDict()
+
+# Stream format of the TTS clips (edge-tts: 24 kHz mono MP3 at 48 kbps).
+# Clips and silence share it so they can be concatenated without re-encoding.
+MP3_SAMPLE_RATE = 24000
+MP3_BITRATE = "48k"
+# Bitrate for audio that has to be re-encoded from PCM; mono 64 kbps is transparent for speech
+SPEECH_EXPORT_BITRATE = "64k"
+
+GEMINI_MODEL = 'gemini-3-flash-preview'
+
+# Longest image side sent to Gemini; text stays legible and phone photos upload several times faster
+MAX_IMAGE_SIDE = 1600
+
+# Retry policy for transient Gemini errors (rate limits, overload)
+GEMINI_MAX_ATTEMPTS = 5
+GEMINI_MAX_BACKOFF_SEC = 30
+# Upper bound on Gemini requests in flight at once, so a large upload does not trip the rate limit
+GEMINI_MAX_CONCURRENCY = 4
+
+def _json_dumps(obj):
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode("utf-8")
+
+def _json_loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+# One aiohttp session per event loop; a session cannot be used from a loop other than its own.
+# Maps each loop to (session, watcher task). The loop itself only holds weak references to
+# tasks, so keeping the watcher here stops it being garbage collected while still pending.
+# Each entry is removed, and its session closed, when that loop shuts down.
+_google_http_sessions = {}
+
+async def google_tts_session():
+    """
+    Shared aiohttp session for Google TTS calls on the running event loop. Requests reuse pooled
+    keep-alive connections and run on the loop itself instead of occupying executor threads.
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    entry = _google_http_sessions.get(loop)
+    if entry is None or entry[0].closed:
+        if entry is not None:
+            entry[1].cancel()
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300))
+        watcher = loop.create_task(_close_session_on_shutdown(loop, session))
+        entry = _google_http_sessions[loop] = (session, watcher)
+    return entry[0]
+
+async def _close_session_on_shutdown(loop, session):
+    # Waits for the life of the loop: asyncio.run() and the like cancel leftover tasks before
+    # closing the loop, which closes the session while the loop can still run its cleanup
+    try:
+        await loop.create_future()
+    finally:
+        entry = _google_http_sessions.get(loop)
+        if entry is not None and entry[0] is session:
+            del _google_http_sessions[loop]
+        await session.close()
+
+def _close_google_tts_sessions():
+    # Loops that are still alive at interpreter exit (e.g. the app's background loop) close theirs here
+    for loop, (session, _) in list(_google_http_sessions.items()):
+        if session.closed or loop.is_closed():
+            continue
+        try:
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=5)
+            else:
+                loop.run_until_complete(session.close())
+        except Exception:
+            pass
+
+atexit.register(_close_google_tts_sessions)
+
+@functools.lru_cache(maxsize=64)
+def _rate_to_speaking_rate(rate):
+    """
+    Maps an edge-tts style rate string (e.g. "-20%") to Google's speakingRate.
+    Google TTS doesn't take "+50%"-style rates; it uses a multiplier from 0.25 to 4.0, default 1.0.
+    A whole job shares one rate, so this is parsed once rather than per request.
+    """
+    speaking_rate = 1.0
+    try:
+        if rate.endswith("%"):
+            # "-20%" -> -0.2 -> 0.8
+            percent = int(rate[:-1])
+            speaking_rate = 1.0 + (percent / 100.0)
+    except (ValueError, AttributeError):
+        pass
+
+    # Clamp rate
+    return max(0.25, min(4.0, speaking_rate))
+
+@functools.lru_cache(maxsize=64)
+def _lang_for_voice(voice):
+    """Google languageCode for a voice name, e.g. "yue-HK-Standard-A" -> "yue-HK"."""
+    language, region = voice.split("-", 2)[:2]
+    return f"{language}-{region}"
+
 async def generate_speech_bytes(text, rate, voice="en-US-AriaNeural", provider="edge"):
     """
     Generates MP3 audio bytes for the given text using edge-tts or Google Cloud TTS.
@@ -24,144 +140,471 @@ async def generate_speech_bytes(text, rate, voice="en-US-AriaNeural", provider="
             
         url = f"https://texttospeech.googleapis.com/v1/text:synthesize?key={api_key}"
         
-        # Google TTS doesn't support "rate" like "+50%" directly in the same way.
-        # It uses "speakingRate" (0.25 to 4.0).
-        # We need to map our rate string (e.g. "-20%") to a float.
-        # Default is 1.0.
-        speaking_rate = 1.0
-        try:
-            if rate.endswith("%"):
-                # "-20%" -> -0.2 -> 0.8
-                percent = int(rate.strip("%"))
-                speaking_rate = 1.0 + (percent / 100.0)
-        except:
-            pass
-            
-        # Clamp rate
-        speaking_rate = max(0.25, min(4.0, speaking_rate))
+        speaking_rate = _rate_to_speaking_rate(rate)
 
         data = {
             "input": {"text": text},
-            "voice": {"languageCode": voice.split("-")[0] + "-" + voice.split("-")[1], "name": voice},
-            "audioConfig": {"audioEncoding": "MP3", "speakingRate": speaking_rate}
+            "voice": {"languageCode": _lang_for_voice(voice), "name": voice},
+            "audioConfig": {"audioEncoding": "MP3", "speakingRate": speaking_rate, "sampleRateHertz": MP3_SAMPLE_RATE}
         }
         
-        # Run synchronous request in async function
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(None, lambda: requests.post(url, headers={"Content-Type": "application/json"}, data=json.dumps(data)))
+        session = await google_tts_session()
+        async with session.post(url, headers={"Content-Type": "application/json"}, data=_json_dumps(data)) as response:
+            payload = await response.read()
         
-        if response.status_code == 200:
-            json_response = response.json()
-            return base64.b64decode(json_response["audioContent"])
+        if response.status == 200:
+            json_response = _json_loads(payload)
+            # base64 is ASCII; decoding from bytes skips b64decode's own str handling
+            return base64.b64decode(json_response["audioContent"].encode("ascii"))
         else:
-            raise Exception(f"Google TTS API failed: {response.text}")
+            raise Exception(f"Google TTS API failed: {payload.decode('utf-8', errors='replace')}")
 
 
     else:
         # Edge TTS
         try:
+            import edge_tts
             communicate = edge_tts.Communicate(text, voice, rate=rate)
-            mp3_data = b""
+            # Accumulate into a bytearray; `bytes +=` would copy the whole buffer per chunk
+            mp3_data = bytearray()
             async for chunk in communicate.stream():
                 if chunk["type"] == "audio":
-                    mp3_data += chunk["data"]
+                    mp3_data.extend(chunk["data"])
             if not mp3_data:
                 raise Exception("No audio received from Edge TTS")
-            return mp3_data
+            return bytes(mp3_data)
         except Exception as e:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] Edge TTS failed: {e}. Falling back to gTTS (Google Translate TTS)...")
-            # Fallback to gTTS
-            # Map voice/lang roughly
-            lang = "en"
-            if "zh-" in voice.lower() or "cmn-" in voice.lower():
-                # Check for Cantonese (HK usually implies Cantonese in this context, TW might be Mandarin or Cantonese but often users expecting Cantonese might select HK voices)
-                # Google Translate TTS uses 'yue' for Cantonese.
-                if "hk" in voice.lower():
-                    lang = "yue"
-                elif "tw" in voice.lower():
-                     # Default TW to zh-tw (Mandarin) unless we want to support TW Cantonese? 
-                     # Usually standard TW voice is Mandarin. 
-                     # But let's check if the user selected a Cantonese specific voice. 
-                     # The user said "picked cantonese", which usually means the language selection.
-                     # In app.py: conv_lang == "Cantonese" -> lang_code = "zh-HK"
-                     # So checking "hk" in voice (which comes from lang_code mapping) is the safest bet for "Cantonese".
-                    lang = "zh-tw" 
-                else:
-                    lang = "zh-cn"
-            
-            from gtts import gTTS
-            
-            def run_gtts():
-                fp = io.BytesIO()
-                tts = gTTS(text=text, lang=lang)
-                tts.write_to_fp(fp)
-                fp.seek(0)
-                return fp.read()
+            return await generate_gtts_bytes(text, voice)
+
+async def generate_gtts_bytes(text, voice):
+    """
+    Fallback synthesis via gTTS (Google Translate TTS) when Edge TTS is unavailable.
+    """
+    # Map voice/lang roughly
+    lang = "en"
+    if "zh-" in voice.lower() or "cmn-" in voice.lower():
+        # Check for Cantonese (HK usually implies Cantonese in this context, TW might be Mandarin or Cantonese but often users expecting Cantonese might select HK voices)
+        # Google Translate TTS uses 'yue' for Cantonese.
+        if "hk" in voice.lower():
+            lang = "yue"
+        elif "tw" in voice.lower():
+             # Default TW to zh-tw (Mandarin) unless we want to support TW Cantonese? 
+             # Usually standard TW voice is Mandarin. 
+             # But let's check if the user selected a Cantonese specific voice. 
+             # The user said "picked cantonese", which usually means the language selection.
+             # In app.py: conv_lang == "Cantonese" -> lang_code = "zh-HK"
+             # So checking "hk" in voice (which comes from lang_code mapping) is the safest bet for "Cantonese".
+            lang = "zh-tw" 
+        else:
+            lang = "zh-cn"
+    
+    from gtts import gTTS
+    
+    def run_gtts():
+        fp = io.BytesIO()
+        tts = gTTS(text=text, lang=lang)
+        tts.write_to_fp(fp)
+        fp.seek(0)
+        return fp.read()
 
-            loop = asyncio.get_event_loop()
-            return await loop.run_in_executor(None, run_gtts)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, run_gtts)
+
+async def generate_speech_to_file(text, rate, path, voice="en-US-AriaNeural", provider="edge"):
+    """
+    Like generate_speech_bytes, but writes the MP3 to `path`.
+    Edge TTS chunks are written as they arrive, so the clip is never held in memory as a whole.
+    Returns `path`.
+    """
+    if provider != "google":
+        try:
+            import edge_tts
+            communicate = edge_tts.Communicate(text, voice, rate=rate)
+            received = False
+            with open(path, "wb") as f:
+                async for chunk in communicate.stream():
+                    if chunk["type"] == "audio":
+                        f.write(chunk["data"])
+                        received = True
+            if not received:
+                raise Exception("No audio received from Edge TTS")
+            return path
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Edge TTS failed: {e}. Falling back to gTTS (Google Translate TTS)...")
+            mp3_bytes = await generate_gtts_bytes(text, voice)
+    else:
+        mp3_bytes = await generate_speech_bytes(text, rate, voice=voice, provider=provider)
+
+    with open(path, "wb") as f:
+        f.write(mp3_bytes)
+    return path
 
 def create_silence(duration_ms):
+    from pydub import AudioSegment
     return AudioSegment.silent(duration=duration_ms)
 
+def join_audio_segments(segments):
+    """
+    Concatenates AudioSegments in a single pass. Repeated `+=` copies the whole
+    accumulated buffer on every append, which is quadratic in the output length.
+    """
+    from pydub import AudioSegment
+    if not segments:
+        return AudioSegment.empty()
+    # Bring every part to a common frame rate / channel count / sample width first
+    segments = AudioSegment._sync(*segments)
+    return segments[0]._spawn(b"".join(seg.raw_data for seg in segments))
+
+@functools.lru_cache(maxsize=None)
+def audio_process_pool():
+    """
+    Worker processes for pydub decode/encode. Both shell out to ffmpeg and then shuffle
+    PCM bytes in Python under the GIL, so separate processes let them use every core.
+    Workers are spawned rather than forked: the pool is created from the app's background
+    loop thread, and forking a multithreaded process can deadlock.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+
+# Audio crosses the process boundary as plain PCM: (raw_data, sample_width, frame_rate, channels)
+def _segment_to_pcm(segment):
+    return segment.raw_data, segment.sample_width, segment.frame_rate, segment.channels
+
+def _segment_from_pcm(raw_data, sample_width, frame_rate, channels):
+    from pydub import AudioSegment
+    return AudioSegment(data=raw_data, sample_width=sample_width, frame_rate=frame_rate, channels=channels)
+
+def _decode_mp3(mp3_bytes):
+    from pydub import AudioSegment
+    return _segment_to_pcm(AudioSegment.from_file(io.BytesIO(mp3_bytes), format="mp3"))
+
+def export_speech_mp3(segment, path):
+    """Encodes speech as mono MP3 at SPEECH_EXPORT_BITRATE instead of pydub's stereo/128k defaults."""
+    segment.set_channels(1).export(path, format="mp3", bitrate=SPEECH_EXPORT_BITRATE)
+    return path
+
+def _export_mp3(raw_data, sample_width, frame_rate, channels, path):
+    return export_speech_mp3(_segment_from_pcm(raw_data, sample_width, frame_rate, channels), path)
+
+def _preview_cache_path(text, rate, voice, provider="edge"):
+    key = hashlib.sha1(f"{provider}|{voice}|{rate}|{text}".encode("utf-8")).hexdigest()
+    return os.path.join(PREVIEW_CACHE_DIR, f"{key}.mp3")
+
+def cached_preview(text, rate, voice, provider="edge"):
+    """
+    Returns the path of a previously synthesized clip for this text/rate/voice, or None on a miss.
+    """
+    path = _preview_cache_path(text, rate, voice, provider)
+    if not os.path.exists(path):
+        return None
+    try:
+        os.utime(path)  # Mark as recently used for LRU pruning
+    except OSError:
+        pass
+    return path
+
+_SILENCE_CLIP_PREFIX = "silence_"
+
+def prune_preview_cache(max_files=PREVIEW_CACHE_MAX_FILES):
+    """
+    Deletes the least recently used clips once the preview cache holds more than max_files.
+    Silence clips are never pruned: there is one per pause length, every job uses them,
+    and a concurrent job may be joining them at this moment.
+    """
+    if not os.path.isdir(PREVIEW_CACHE_DIR):
+        return
+    with os.scandir(PREVIEW_CACHE_DIR) as it:
+        entries = [e for e in it if e.name.endswith(".mp3") and not e.name.startswith(_SILENCE_CLIP_PREFIX)]
+    if len(entries) <= max_files:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - max_files]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+@functools.lru_cache(maxsize=16)
+def encode_silence(duration_ms):
+    """
+    Returns MP3 bytes of silence in the same stream format as the TTS clips, encoded once per duration.
+    """
+    silence = create_silence(duration_ms).set_frame_rate(MP3_SAMPLE_RATE).set_channels(1)
+    # Bare MP3 frames only: ID3/Xing headers in the middle of a stream upset decoders
+    buf = silence.export(io.BytesIO(), format="mp3", bitrate=MP3_BITRATE,
+                         parameters=["-write_xing", "0", "-id3v2_version", "0"])
+    return buf.getvalue()
+
+# Clip path -> task for clips being synthesized right now
+_pending_clips = {}
+
+async def synthesize_to_cache(text, rate, voice="en-US-AriaNeural", provider="edge"):
+    """
+    Returns the cached clip path for this text/rate/voice, synthesizing it straight into the cache on a miss.
+    """
+    cached_path = cached_preview(text, rate, voice, provider)
+    if cached_path:
+        return cached_path
+
+    path = _preview_cache_path(text, rate, voice, provider)
+    # Callers asking for a clip that is already being synthesized wait on the same request
+    task = _pending_clips.get(path)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_synthesize_clip(text, rate, voice, provider, path))
+        _pending_clips[path] = task
+        task.add_done_callback(functools.partial(_forget_pending_clip, path))
+    # Shielded so one caller giving up does not cancel the clip for the others
+    return await asyncio.shield(task)
+
+def _forget_pending_clip(path, task):
+    if _pending_clips.get(path) is task:
+        del _pending_clips[path]
+    if not task.cancelled():
+        task.exception()  # Mark it retrieved even if every waiter has gone
+
+async def _synthesize_clip(text, rate, voice, provider, path):
+    os.makedirs(PREVIEW_CACHE_DIR, exist_ok=True)
+    # Write to a temp file first so concurrent readers never see a partial clip
+    fd, part_path = tempfile.mkstemp(dir=PREVIEW_CACHE_DIR, suffix=".part")
+    os.close(fd)
+    try:
+        await generate_speech_to_file(text, rate, part_path, voice=voice, provider=provider)
+        os.replace(part_path, path)
+        return path
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+def _read_file_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+async def cached_speech_bytes(text, rate, voice="en-US-AriaNeural", provider="edge"):
+    """
+    generate_speech_bytes backed by the clip cache: memory first, then disk, then the TTS provider.
+    """
+    key = _preview_cache_path(text, rate, voice, provider)
+    mp3_bytes = _speech_memory_cache.get(key)
+    if mp3_bytes is not None:
+        _speech_memory_cache.move_to_end(key)
+        return mp3_bytes
+
+    path = await synthesize_to_cache(text, rate, voice=voice, provider=provider)
+    mp3_bytes = await asyncio.get_running_loop().run_in_executor(None, _read_file_bytes, path)
+    _speech_memory_cache[key] = mp3_bytes
+    while len(_speech_memory_cache) > SPEECH_MEMORY_CACHE_MAX:
+        _speech_memory_cache.popitem(last=False)
+    return mp3_bytes
+
+def start_clip_synthesis(texts, rate, voice="en-US-AriaNeural", provider="edge", concurrency=TTS_CONCURRENCY):
+    """
+    Schedules synthesis of each text and returns one task per text, in input order.
+    Each task resolves to the path of the cached MP3 clip.
+    At most `concurrency` TTS requests are in flight at once to avoid provider throttling.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def synthesize_one(text):
+        # Reuse a cached clip when this exact text was synthesized before
+        cached_path = cached_preview(text, rate, voice, provider)
+        if cached_path:
+            return cached_path
+        async with sem:
+            return await synthesize_to_cache(text, rate, voice=voice, provider=provider)
+
+    return [asyncio.ensure_future(synthesize_one(text)) for text in texts]
+
+async def synthesize_clips(texts, rate, voice="en-US-AriaNeural", provider="edge", concurrency=TTS_CONCURRENCY):
+    """
+    Synthesizes a list of texts concurrently and returns the paths of their cached MP3 clips in input order.
+    """
+    return await asyncio.gather(*start_clip_synthesis(texts, rate, voice=voice, provider=provider, concurrency=concurrency))
+
+def silence_clip_path(duration_ms):
+    """
+    Returns the path of an MP3 file holding `duration_ms` of silence, encoding it on first use.
+    """
+    path = os.path.join(PREVIEW_CACHE_DIR, f"{_SILENCE_CLIP_PREFIX}{duration_ms}ms.mp3")
+    if not os.path.exists(path):
+        os.makedirs(PREVIEW_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=PREVIEW_CACHE_DIR, suffix=".part", delete=False) as f:
+            f.write(encode_silence(duration_ms))
+        os.replace(f.name, path)
+    return path
+
+def _concat_list_entry(path):
+    # Quote for ffmpeg's concat demuxer: ' is written as '\''
+    return "file '" + os.path.abspath(path).replace("'", "'\\''") + "'\n"
+
+def concat_mp3_files(paths, output_path):
+    """
+    Joins MP3 files into output_path without re-encoding.
+    Uses ffmpeg's concat demuxer with stream copy (which also writes proper headers for seeking),
+    falling back to appending the raw MP3 frames if ffmpeg is unavailable or fails.
+    The result is written to a temp file and then moved over output_path, so a previous file
+    at that path (which may be hard-linked into the recordings library) is never modified.
+    """
+    fd, part_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or None, suffix=".mp3")
+    os.close(fd)
+    try:
+        # Frames can only be spliced when every clip shares one sample rate and channel layout
+        formats = {mp3_stream_format(path) for path in set(paths)} - {None}
+        if len(formats) > 1:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Mixed MP3 formats {sorted(formats)}; re-encoding instead of joining frames.")
+            _pydub_concat(paths, part_path)
+        elif not _ffmpeg_concat(paths, part_path):
+            with open(part_path, "wb") as out:
+                for path in paths:
+                    with open(path, "rb") as clip:
+                        shutil.copyfileobj(clip, out)
+        os.replace(part_path, output_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return output_path
+
+def _pydub_concat(paths, output_path):
+    from pydub import AudioSegment
+    # Decode each distinct clip once, join, and re-encode in the standard clip format
+    decoded = {path: AudioSegment.from_file(path, format="mp3") for path in set(paths)}
+    combined = join_audio_segments([decoded[path] for path in paths])
+    combined.set_frame_rate(MP3_SAMPLE_RATE).set_channels(1).export(output_path, format="mp3", bitrate=MP3_BITRATE)
+
+# Sample rates by MPEG version bits (MPEG 2.5, reserved, MPEG 2, MPEG 1) and rate index
+_MP3_SAMPLE_RATES = {
+    0b00: (11025, 12000, 8000),
+    0b10: (22050, 24000, 16000),
+    0b11: (44100, 48000, 32000),
+}
+
+def mp3_stream_format(path):
+    """
+    Returns (sample_rate, channels) from the first MPEG audio frame header in the file,
+    skipping any ID3v2 tag. Returns None if no valid frame header is found.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(10)
+            offset = 0
+            if len(head) == 10 and head[:3] == b"ID3":
+                # Syncsafe size: 7 bits per byte, plus the 10-byte header and optional footer
+                size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+                offset = 10 + size + (10 if head[5] & 0x10 else 0)
+            f.seek(offset)
+            data = f.read(4096)
+    except OSError:
+        return None
+
+    for i in range(len(data) - 3):
+        if data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+            continue
+        version = (data[i + 1] >> 3) & 0b11
+        layer = (data[i + 1] >> 1) & 0b11
+        rate_index = (data[i + 2] >> 2) & 0b11
+        if version not in _MP3_SAMPLE_RATES or layer == 0 or rate_index == 0b11:
+            continue
+        channels = 1 if (data[i + 3] >> 6) == 0b11 else 2
+        return _MP3_SAMPLE_RATES[version][rate_index], channels
+    return None
+
+def _ffmpeg_concat(paths, output_path):
+    # Returns True if ffmpeg stitched the files, False if the caller should fall back
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return False
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+        f.writelines(_concat_list_entry(path) for path in paths)
+    try:
+        subprocess.run(
+            [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", f.name, "-c", "copy", output_path],
+            check=True, capture_output=True
+        )
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] ffmpeg concat failed: {e.stderr.decode(errors='replace').strip()}. Joining raw MP3 frames instead.")
+        return False
+    finally:
+        os.remove(f.name)
+
+# Spoken forms of punctuation for dictation practice
+_PUNCT_MAP_ZH = {
+    "，": " 逗號 ",
+    "。": " 句號 ",
+    "？": " 問號 ",
+    "！": " 驚嘆號 ",
+    "；": " 分號 ",
+    "：": " 冒號 ",
+    "「": " 上引號 ",
+    "」": " 下引號 ",
+    "（": " 左括號 ",
+    "）": " 右括號 ",
+    "、": " 頓號 ",
+    ".": " 句號 ", # Handle standard punctuation in Chinese text too
+    ",": " 逗號 ",
+    "?": " 問號 ",
+    "!": " 驚嘆號 "
+}
+
+_PUNCT_MAP_EN = {
+    ".": " period ",
+    ",": " comma ",
+    "?": " question mark ",
+    "!": " exclamation mark ",
+    ";": " semi-colon ",
+    ":": " colon ",
+    "\"": " quote ",
+    "'": " apostrophe ",
+    "-": " hyphen ",
+    "(": " open bracket ",
+    ")": " close bracket "
+}
+
+# Every key is a single character, so one str.translate pass replaces them all.
+# Tables are built once at import; clean_text_for_reading runs for every sentence.
+_PUNCT_TABLE_ZH = str.maketrans(_PUNCT_MAP_ZH)
+_PUNCT_TABLE_EN = str.maketrans(_PUNCT_MAP_EN)
+_WS_RE = re.compile(r'\s+')
+
+# (translation table, punctuation characters) per language; anything else is read as English
+_PUNCT_RULES_EN = (_PUNCT_TABLE_EN, frozenset(_PUNCT_MAP_EN))
+_PUNCT_RULES = {
+    "zh-tw": (_PUNCT_TABLE_ZH, frozenset(_PUNCT_MAP_ZH)),
+}
+
 def clean_text_for_reading(text, language="en"):
     """
     Replaces punctuation with spoken words for dictation practice.
     Supports English ('en') and Traditional Chinese ('zh-tw').
     """
-    if language == "zh-tw":
-        replacements = {
-            "，": " 逗號 ",
-            "。": " 句號 ",
-            "？": " 問號 ",
-            "！": " 驚嘆號 ",
-            "；": " 分號 ",
-            "：": " 冒號 ",
-            "「": " 上引號 ",
-            "」": " 下引號 ",
-            "（": " 左括號 ",
-            "）": " 右括號 ",
-            "、": " 頓號 ",
-            ".": " 句號 ", # Handle standard punctuation in Chinese text too
-            ",": " 逗號 ",
-            "?": " 問號 ",
-            "!": " 驚嘆號 "
-        }
-    else:
-        replacements = {
-            ".": " period ",
-            ",": " comma ",
-            "?": " question mark ",
-            "!": " exclamation mark ",
-            ";": " semi-colon ",
-            ":": " colon ",
-            "\"": " quote ",
-            "'": " apostrophe ",
-            "-": " hyphen ",
-            "(": " open bracket ",
-            ")": " close bracket "
-        }
-    
-    # Sort keys by length descending to avoid partial replacements
-    sorted_keys = sorted(replacements.keys(), key=len, reverse=True)
-    
-    # Escape keys for regex
-    pattern = re.compile("|".join(re.escape(k) for k in sorted_keys))
-    
-    text = pattern.sub(lambda m: replacements[m.group(0)], text)
-    
+    table, punctuation = _PUNCT_RULES.get(language, _PUNCT_RULES_EN)
+    # Text without any punctuation to read out only needs its whitespace tidied
+    if not punctuation.isdisjoint(text):
+        text = text.translate(table)
+
     # Collapse multiple spaces
-    return re.sub(r'\s+', ' ', text).strip()
+    return _WS_RE.sub(' ', text).strip()
+
+# Split by [.?!] or [。？！] and now commas [,] or [，]
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.?!,。？！，])\s*')
 
 def split_into_sentences(text):
     """
     Splits text into sentences.
     Simple split by period, question mark, exclamation mark (English and Chinese).
     """
-    # Split by [.?!] or [。？！] and now commas [,] or [，]
-    sentences = re.split(r'(?<=[.?!,。？！，])\s*', text)
+    sentences = _SENTENCE_SPLIT_RE.split(text)
     return [s.strip() for s in sentences if s.strip()]
 
+def _as_sentences(passage):
+    # Accept either raw passage text or a list already produced by split_into_sentences
+    if isinstance(passage, str):
+        return split_into_sentences(passage)
+    return list(passage)
+
 async def process_vocabulary(vocab_list, rate, repeats=1, silence_duration_sec=3, shuffle=False, voice="en-US-AriaNeural", provider="edge"):
     """
     Generates audio for vocabulary list with configurable repeats and silence.
@@ -170,30 +613,31 @@ async def process_vocabulary(vocab_list, rate, repeats=1, silence_duration_sec=3
     if not vocab_list:
         return None
 
-    # Shuffle if requested
-    processing_list = list(vocab_list)
-    if shuffle:
-        random.shuffle(processing_list)
+    # Shuffle if requested; either way a fresh list, so the caller's vocab_list is untouched
+    processing_list = random.sample(vocab_list, len(vocab_list)) if shuffle else list(vocab_list)
 
     temp_dir = tempfile.gettempdir()
-    combined_vocab_audio = AudioSegment.empty()
-    silence = create_silence(silence_duration_sec * 1000)
+    silence_path = silence_clip_path(int(silence_duration_sec * 1000))
 
-    for i, word in enumerate(processing_list):
-        word_bytes = await generate_speech_bytes(word, rate, voice=voice, provider=provider)
-        word_audio = AudioSegment.from_file(io.BytesIO(word_bytes), format="mp3")
+    # Synthesize all words concurrently, then stitch them in the original order
+    word_clip_paths = await synthesize_clips(processing_list, rate, voice=voice, provider=provider)
 
+    parts = []
+    for clip_path in word_clip_paths:
         # For each word, repeat 'repeats' times with silence in between
-        segment = AudioSegment.empty()
-        for _ in range(repeats):
-            segment += word_audio + silence
-        
-        combined_vocab_audio += segment
+        parts.extend([clip_path, silence_path] * repeats)
 
+    # Clips share one stream format, so they are remuxed rather than decoded and re-encoded
     vocab_audio_path = os.path.join(temp_dir, "vocab_practice.mp3")
-    combined_vocab_audio.export(vocab_audio_path, format="mp3")
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, concat_mp3_files, parts, vocab_audio_path)
+
+    prune_preview_cache()
     return vocab_audio_path
 
+# Any character other than a letter/digit (Unicode-aware, like str.isalnum), '_' or '-'
+_UNSAFE_NAME_CHAR_RE = re.compile(r'[^\w-]')
+
 def save_audio_file(source_path, name, suffix):
     """
     Saves the audio file to the 'recordings' directory.
@@ -205,9 +649,7 @@ def save_audio_file(source_path, name, suffix):
     os.makedirs(recordings_dir, exist_ok=True)
     
     # Sanitize name
-    safe_name = "".join([c if c.isalnum() or c in ('-', '_') else '_' for c in name]).strip('_')
-    if not safe_name:
-        safe_name = "recording"
+    safe_name = _UNSAFE_NAME_CHAR_RE.sub('_', name).strip('_') or "recording"
         
     filename = f"{safe_name}_{suffix}.mp3"
     dest_path = os.path.join(recordings_dir, filename)
@@ -223,64 +665,183 @@ def save_audio_file(source_path, name, suffix):
         filename = f"{safe_name}_{suffix}_{timestamp}.mp3"
         dest_path = os.path.join(recordings_dir, filename)
 
-    shutil.copy2(source_path, dest_path)
+    # Hard-link when possible so saving doesn't copy the whole file. This is safe because
+    # generated files are always replaced with a new file, never rewritten in place.
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        # e.g. temp dir on another filesystem, or no hard link support
+        if not _clone_file(source_path, dest_path):
+            shutil.copy2(source_path, dest_path)
     return dest_path
 
+def _clone_file(source_path, dest_path):
+    """
+    Copies with os.copy_file_range, which shares extents (reflink) on btrfs/XFS and otherwise
+    copies inside the kernel. Returns False if that isn't possible, so the caller can fall back.
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
+    created = False
+    try:
+        with open(source_path, "rb") as src, open(dest_path, "wb") as dst:
+            created = True
+            remaining = os.fstat(src.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    raise OSError("copy_file_range stopped early")
+                remaining -= copied
+        shutil.copystat(source_path, dest_path)
+        return True
+    except OSError:
+        # e.g. EXDEV on older kernels, or a filesystem without support
+        if created and os.path.exists(dest_path):
+            os.remove(dest_path)
+        return False
+
+
+def _sentence_block(clip, sentence_repeats, silence_between_repeats, silence_between_sentences):
+    """
+    Returns the ordered parts for one sentence: each repeat, the pauses between them, and the closing pause.
+    Works on file paths and on already-loaded MP3 bytes alike; the same objects are referenced, never copied.
+    """
+    parts = []
+    for i in range(sentence_repeats):
+        parts.append(clip)
+        parts.append(silence_between_repeats if i < sentence_repeats - 1 else silence_between_sentences)
+    return parts
 
 async def process_passage(passage_text, rate, sentence_repeats=3, language="en", voice="en-US-AriaNeural", provider="edge", sentence_pause_sec=2.0, repeat_pause_sec=1.0):
     """
     Generates audio for passage with punctuation reading and sentence repetition.
+    passage_text may also be a list of sentences already split by split_into_sentences.
     Returns path to generated file.
     """
     if not passage_text:
         return None
 
     temp_dir = tempfile.gettempdir()
-    combined_passage_audio = AudioSegment.empty()
-    silence_between_sentences = create_silence(sentence_pause_sec * 1000) # Configurable silence between sentences
-    silence_between_repeats = create_silence(repeat_pause_sec * 1000) # Configurable silence between repeats of same sentence
+    silence_between_sentences = silence_clip_path(int(sentence_pause_sec * 1000)) # Configurable silence between sentences
+    silence_between_repeats = silence_clip_path(int(repeat_pause_sec * 1000)) # Configurable silence between repeats of same sentence
 
-    sentences = split_into_sentences(passage_text)
+    sentences = _as_sentences(passage_text)
 
-    for sentence in sentences:
-        # Convert punctuation to text
-        spoken_sentence = clean_text_for_reading(sentence, language=language)
-        
-        # Generate audio for the modified sentence
-        sentence_bytes = await generate_speech_bytes(spoken_sentence, rate, voice=voice, provider=provider)
-        sentence_audio = AudioSegment.from_file(io.BytesIO(sentence_bytes), format="mp3")
-
-        # Repeat the sentence
-        sentence_block = AudioSegment.empty()
-        for i in range(sentence_repeats):
-            sentence_block += sentence_audio
-            if i < sentence_repeats - 1:
-                sentence_block += silence_between_repeats
-        
-        combined_passage_audio += sentence_block + silence_between_sentences
+    # Convert punctuation to text, then synthesize all sentences concurrently
+    spoken_sentences = [clean_text_for_reading(sentence, language=language) for sentence in sentences]
+
+    sentence_clip_paths = await synthesize_clips(spoken_sentences, rate, voice=voice, provider=provider)
+
+    parts = []
+    for clip_path in sentence_clip_paths:
+        parts.extend(_sentence_block(clip_path, sentence_repeats, silence_between_repeats, silence_between_sentences))
 
     passage_audio_path = os.path.join(temp_dir, "passage_reading.mp3")
-    combined_passage_audio.export(passage_audio_path, format="mp3")
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, concat_mp3_files, parts, passage_audio_path)
+
+    prune_preview_cache()
     return passage_audio_path
 
-def extract_text_from_image(image_bytes):
+async def process_passage_stream(passage_text, rate, sentence_repeats=3, language="en", voice="en-US-AriaNeural", provider="edge", sentence_pause_sec=2.0, repeat_pause_sec=1.0):
+    """
+    Async generator version of process_passage for incremental playback.
+    Accepts passage text or a pre-split list of sentences, like process_passage.
+    Yields (index, mp3_bytes) for each sentence block in passage order as soon as it is ready,
+    while later sentences are still being synthesized.
+    """
+    if not passage_text:
+        return
+
+    silence_between_sentences = silence_clip_path(int(sentence_pause_sec * 1000))
+    silence_between_repeats = silence_clip_path(int(repeat_pause_sec * 1000))
+
+    spoken_sentences = [clean_text_for_reading(sentence, language=language) for sentence in _as_sentences(passage_text)]
+    # Pauses are the same for every sentence, so load them once
+    repeat_pause = _read_file_bytes(silence_between_repeats)
+    sentence_pause = _read_file_bytes(silence_between_sentences)
+
+    tasks = start_clip_synthesis(spoken_sentences, rate, voice=voice, provider=provider)
+    try:
+        for index, task in enumerate(tasks):
+            clip = _read_file_bytes(await task)
+            yield index, b"".join(_sentence_block(clip, sentence_repeats, repeat_pause, sentence_pause))
+    finally:
+        # Stop outstanding synthesis if the consumer goes away early
+        for task in tasks:
+            task.cancel()
+
+def generate_content_with_retry(model, contents, **kwargs):
+    """
+    Calls model.generate_content (passing through any keyword arguments), retrying 429 (ResourceExhausted) and 503 (ServiceUnavailable)
+    responses with exponential backoff. Other errors are raised immediately.
+    """
+    from google.api_core import exceptions as google_exceptions
+
+    retryable = (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable)
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        try:
+            return model.generate_content(contents, **kwargs)
+        except retryable as e:
+            if attempt == GEMINI_MAX_ATTEMPTS - 1:
+                raise
+            delay = min(GEMINI_MAX_BACKOFF_SEC, 2 ** attempt)
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Gemini request failed ({e}). Retrying in {delay}s...")
+            time.sleep(delay)
+
+def prepare_image_for_extraction(image_bytes, mime_type="image/jpeg"):
+    """
+    Downscales photos larger than MAX_IMAGE_SIDE and re-encodes them as JPEG to cut upload size.
+    Returns (payload_bytes, mime_type). Smaller images are returned untouched.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))  # Lazy: only the header is read here
+        if max(image.size) <= MAX_IMAGE_SIDE:
+            return image_bytes, mime_type
+
+        # Let the JPEG decoder scale down while decoding instead of decoding full size
+        image.draft("RGB", (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+        # Apply EXIF rotation now, since the re-encoded image drops the orientation tag
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.LANCZOS)
+
+        buf = io.BytesIO()
+        image.convert("RGB").save(buf, format="JPEG", quality=85, optimize=True)
+        return buf.getvalue(), "image/jpeg"
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not downscale image, sending original: {e}")
+        return image_bytes, mime_type
+
+# Structured output: Gemini returns bare JSON matching this schema, with no markdown fences or prose
+EXTRACTION_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "object",
+        "properties": {
+            "vocabulary": {"type": "array", "items": {"type": "string"}},
+            "passage": {"type": "string"},
+            "language": {"type": "string", "format": "enum", "enum": ["en", "zh-tw"]},
+        },
+        "required": ["vocabulary", "passage", "language"],
+    },
+}
+
+def extract_text_from_image(image_bytes, mime_type="image/jpeg", model=None):
     """
     Sends image to Gemini Flash to extract vocabulary, passage, and language.
+    Pass `model` to reuse an existing GenerativeModel instead of creating one per call.
     """
     import google.generativeai as genai
-    from PIL import Image
     
     try:
-        model = genai.GenerativeModel('gemini-3-flash-preview')
+        if model is None:
+            model = genai.GenerativeModel(GEMINI_MODEL)
         
         prompt = """
         Analyze this image and extract the text for a dictation practice session.
-        Return ONLY a raw JSON object (no markdown formatting) with the following structure:
-        {
-            "vocabulary": ["word1", "word2", ...],
-            "passage": "The full passage text...",
-            "language": "en" 
-        }
+        Return a JSON object with "vocabulary" (list of words), "passage" (the full passage text) and "language".
         "language" should be "en" for English or "zh-tw" for Traditional Chinese. Default to "en" if unsure.
         
         IMPORTANT FOR CHINESE TEXT:
@@ -291,26 +852,17 @@ def extract_text_from_image(image_bytes):
         
         If there is only vocabulary, leave "passage" as an empty string.
         If there is only a passage, leave "vocabulary" as an empty list.
-        Ensure the JSON is valid.
         """
         
-        # Convert bytes back to image for Gemini if needed, or pass bytes directly if supported.
-        # Gemini Python SDK supports PIL Image.
-        image = Image.open(io.BytesIO(image_bytes))
+        # Pass the encoded image straight through; decoding it with PIL would only
+        # have the SDK re-encode it for upload.
+        image = {"mime_type": mime_type or "image/jpeg", "data": image_bytes}
         
-        response = model.generate_content([prompt, image])
+        response = generate_content_with_retry(model, [prompt, image], generation_config=EXTRACTION_GENERATION_CONFIG)
         text = response.text
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Raw Gemini response: {text}")
         
-        # Clean up potential markdown code blocks
-        cleaned_text = text.strip()
-        if cleaned_text.startswith("```json"):
-            cleaned_text = cleaned_text[7:]
-        if cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[:-3]
-        cleaned_text = cleaned_text.strip()
-            
-        return json.loads(cleaned_text)
+        return json.loads(text)
     except Exception as e:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Error extracting text: {e}")
         if 'text' in locals():
@@ -320,30 +872,37 @@ def extract_text_from_image(image_bytes):
 async def process_audio_generation(vocab_list, passage_text, vocab_rate, passage_rate, vocab_repeats, vocab_silence, passage_repeats, passage_sentence_pause, passage_repeat_pause, shuffle_vocab, language, voice, provider):
     """
     Orchestrates the audio generation process.
+    Vocabulary and passage are independent, so they are generated concurrently.
     Returns paths to the generated temporary files.
     """
-    vocab_audio_path = None
-    passage_audio_path = None
+    async def no_audio():
+        return None
 
     # --- Process Vocabulary ---
     if vocab_list:
-        vocab_audio_path = await process_vocabulary(vocab_list, vocab_rate, repeats=vocab_repeats, silence_duration_sec=vocab_silence, shuffle=shuffle_vocab, voice=voice, provider=provider)
+        vocab_job = process_vocabulary(vocab_list, vocab_rate, repeats=vocab_repeats, silence_duration_sec=vocab_silence, shuffle=shuffle_vocab, voice=voice, provider=provider)
+    else:
+        vocab_job = no_audio()
 
     # --- Process Passage ---
     if passage_text:
-        passage_audio_path = await process_passage(passage_text, passage_rate, sentence_repeats=passage_repeats, language=language, voice=voice, provider=provider, sentence_pause_sec=passage_sentence_pause, repeat_pause_sec=passage_repeat_pause)
+        passage_job = process_passage(passage_text, passage_rate, sentence_repeats=passage_repeats, language=language, voice=voice, provider=provider, sentence_pause_sec=passage_sentence_pause, repeat_pause_sec=passage_repeat_pause)
+    else:
+        passage_job = no_audio()
 
+    vocab_audio_path, passage_audio_path = await asyncio.gather(vocab_job, passage_job)
     return vocab_audio_path, passage_audio_path
 # --- New Conversation Logic ---
 
-import google.generativeai as genai
-
-def analyze_transcript(text, num_speakers, language_code="zh-HK"):
+def analyze_transcript(text, num_speakers, language_code="zh-HK", model=None):
     """
     Uses Gemini to analyze the transcript and split it into speaker segments.
     """
+    import google.generativeai as genai
+
     try:
-        model = genai.GenerativeModel('gemini-3-flash-preview')
+        if model is None:
+            model = genai.GenerativeModel(GEMINI_MODEL)
         
         prompt = f"""
         Analyze the following text and split it into a conversation between up to {num_speakers} speakers.
@@ -365,7 +924,7 @@ def analyze_transcript(text, num_speakers, language_code="zh-HK"):
         {text}
         """
         
-        response = model.generate_content(prompt)
+        response = generate_content_with_retry(model, prompt)
         content = response.text
         
         # Clean markdown
@@ -385,6 +944,7 @@ async def generate_conversation_audio(segments, language_code="zh-HK", provider=
     Generates audio for a conversation list.
     segments: [{"speaker_id": 1, "text": "Hello"}, ...]
     """
+    from pydub import AudioSegment
     if not segments:
         return None
         
@@ -409,34 +969,39 @@ async def generate_conversation_audio(segments, language_code="zh-HK", provider=
     available_voices = voice_map.get(language_code, voice_map.get("en-US", []))
     
     temp_dir = tempfile.gettempdir()
-    combined_audio = AudioSegment.empty()
-    pause = AudioSegment.silent(duration=300) # 300ms pause between turns
-    
-    for seg in segments:
-        text = seg.get("text", "")
-        if not text:
-            continue
-            
-        speaker_id = seg.get("speaker_id", 1)
-        
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(TTS_CONCURRENCY)
+
+    async def render_segment(text, speaker_id):
         # Select voice based on speaker_id (round-robin)
         # speaker_id 1 -> index 0
         voice_index = (speaker_id - 1) % len(available_voices)
         selected_voice = available_voices[voice_index]
-        
+
         try:
             # Generate audio for this segment
             # We use default rate "+0%" for conversation
-            audio_bytes = await generate_speech_bytes(text, "+0%", voice=selected_voice, provider=provider)
-            segment_audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format="mp3")
-            
-            combined_audio += segment_audio + pause
-            
+            async with sem:
+                audio_bytes = await cached_speech_bytes(text, "+0%", voice=selected_voice, provider=provider)
+            # Decode in a worker process so it overlaps with requests still in flight
+            return _segment_from_pcm(*await loop.run_in_executor(audio_process_pool(), _decode_mp3, audio_bytes))
         except Exception as e:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] Failed to generate segment for {speaker_id}: {e}")
-            continue
+            return None
+
+    # All turns are synthesized concurrently; gather keeps them in conversation order
+    segment_audios = await asyncio.gather(*(
+        render_segment(seg["text"], seg.get("speaker_id", 1)) for seg in segments if seg.get("text", "")
+    ))
+
+    pause = AudioSegment.silent(duration=300) # 300ms pause between turns
+    parts = []
+    for segment_audio in segment_audios:
+        if segment_audio is not None:
+            parts.extend([segment_audio, pause])
+    combined_audio = join_audio_segments(parts)
 
     output_path = os.path.join(temp_dir, "conversation_output.mp3")
-    combined_audio.export(output_path, format="mp3")
+    await loop.run_in_executor(audio_process_pool(), _export_mp3, *_segment_to_pcm(combined_audio), output_path)
     return output_path
 
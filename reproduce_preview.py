@@ -15,10 +15,10 @@ async def test_direct_edge():
             else:
                 communicate = edge_tts.Communicate(text, voice, rate=r)
             
-            data = b""
+            data = bytearray()
             async for chunk in communicate.stream():
                 if chunk["type"] == "audio":
-                    data += chunk["data"]
+                    data.extend(chunk["data"])
             print(f"Success! Bytes: {len(data)}")
         except Exception as e:
             print(f"Failed with rate {r}: {e}")
@@ -1,12 +1,30 @@
 import pytest
+import asyncio
+import gc
+import shutil
 import sys
 import os
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import ANY, AsyncMock, MagicMock, patch
 
 # Add project root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from logic import clean_text_for_reading, split_into_sentences, process_vocabulary, process_passage, save_audio_file
+import logic
+from logic import clean_text_for_reading, split_into_sentences, process_vocabulary, process_passage, process_passage_stream, save_audio_file, generate_content_with_retry, prepare_image_for_extraction
+
+@pytest.fixture(autouse=True)
+def isolated_preview_cache(tmp_path, monkeypatch):
+    # Keep cached clips from leaking between tests (and into the working tree)
+    monkeypatch.setattr(logic, "PREVIEW_CACHE_DIR", str(tmp_path / "previews"))
+    monkeypatch.setattr(logic, "_speech_memory_cache", logic.OrderedDict())
+
+def fake_speech_to_file(mp3_bytes=None):
+    # Stands in for generate_speech_to_file; writes mp3_bytes (or the text itself) to the target path
+    async def write(text, rate, path, **kwargs):
+        with open(path, "wb") as f:
+            f.write(mp3_bytes if mp3_bytes is not None else text.encode())
+        return path
+    return AsyncMock(side_effect=write)
 
 def test_clean_text_for_reading():
     # English tests
@@ -18,6 +36,9 @@ def test_clean_text_for_reading():
     assert clean_text_for_reading("你好，世界。", language="zh-tw") == "你好 逗號 世界 句號"
     assert clean_text_for_reading("真的嗎？", language="zh-tw") == "真的嗎 問號"
 
+    # No punctuation: only whitespace is normalized
+    assert clean_text_for_reading("  no   punctuation here ") == "no punctuation here"
+
 def test_split_into_sentences():
     text = "Hello world. How are you? I am fine!"
     sentences = split_into_sentences(text)
@@ -36,39 +57,34 @@ def test_split_into_sentences():
 
 @pytest.mark.asyncio
 async def test_process_vocabulary():
-    with patch('logic.generate_speech_bytes', new_callable=AsyncMock) as mock_gen:
-        mock_gen.return_value = b'fake_mp3_bytes'
-        
-        with patch('pydub.AudioSegment.from_file') as mock_from_file, \
-             patch('pydub.AudioSegment.empty') as mock_empty, \
-             patch('pydub.AudioSegment.silent') as mock_silent:
-            
-            mock_audio = MagicMock()
-            mock_from_file.return_value = mock_audio
-            mock_empty.return_value = MagicMock()
-            mock_silent.return_value = MagicMock()
-            
-            mock_audio.__add__.return_value = mock_audio
-            mock_empty.return_value.__add__.return_value = mock_empty.return_value
-            
-            # Test with shuffle=False and specific voice
-            path = await process_vocabulary(["test"], "+0%", repeats=2, silence_duration_sec=1, shuffle=False, voice="zh-TW-HsiaoChenNeural", provider="edge")
-            assert mock_gen.call_count == 1
-            # Verify voice and provider passed
-            mock_gen.assert_called_with("test", "+0%", voice="zh-TW-HsiaoChenNeural", provider="edge")
-            assert path is not None
-            
-            # Test with Google provider
-            path_google = await process_vocabulary(["test"], "+0%", repeats=1, silence_duration_sec=1, shuffle=False, voice="cmn-CN-Standard-A", provider="google")
-            mock_gen.assert_called_with("test", "+0%", voice="cmn-CN-Standard-A", provider="google")
-
-            # Test with shuffle=True (mock random.shuffle)
-            with patch('random.shuffle') as mock_shuffle:
-                await process_vocabulary(["a", "b", "c"], "+0%", shuffle=True)
-                mock_shuffle.assert_called_once()
+    with patch('logic.generate_speech_to_file', new=fake_speech_to_file(b'fake_mp3_bytes')) as mock_gen, \
+         patch('logic.encode_silence', return_value=b'<silence>'):
+
+        # Test with shuffle=False and specific voice
+        path = await process_vocabulary(["test"], "+0%", repeats=2, silence_duration_sec=1, shuffle=False, voice="zh-TW-HsiaoChenNeural", provider="edge")
+        assert mock_gen.call_count == 1
+        # Verify voice and provider passed
+        mock_gen.assert_called_with("test", "+0%", ANY, voice="zh-TW-HsiaoChenNeural", provider="edge")
+        assert path is not None
+        # Clips are joined as raw MP3 bytes, each repeat followed by silence
+        with open(path, "rb") as f:
+            assert f.read() == b'fake_mp3_bytes<silence>' * 2
+
+        # Test with Google provider
+        path_google = await process_vocabulary(["test"], "+0%", repeats=1, silence_duration_sec=1, shuffle=False, voice="cmn-CN-Standard-A", provider="google")
+        mock_gen.assert_called_with("test", "+0%", ANY, voice="cmn-CN-Standard-A", provider="google")
+
+        # Test with shuffle=True (mock random.sample)
+        words = ["a", "b", "c"]
+        with patch('random.sample', return_value=["c", "a", "b"]) as mock_sample:
+            await process_vocabulary(words, "+0%", shuffle=True)
+            mock_sample.assert_called_once_with(words, 3)
+        mock_gen.assert_called_with("b", "+0%", ANY, voice="en-US-AriaNeural", provider="edge")
+        assert words == ["a", "b", "c"]
 
 def test_save_audio_file():
     with patch('os.makedirs') as mock_makedirs, \
+         patch('os.link', side_effect=OSError("cross-device link")) as mock_link, \
          patch('shutil.copy2') as mock_copy, \
          patch('os.path.exists') as mock_exists, \
          patch('os.getcwd') as mock_getcwd:
@@ -82,33 +98,380 @@ def test_save_audio_file():
         path = save_audio_file("/tmp/source.mp3", "My Recording", "vocab")
 
         mock_makedirs.assert_called_with(os.path.join("/fake/cwd", "recordings"), exist_ok=True)
+        # Hard link attempted first, copy used as the fallback
+        mock_link.assert_called_once()
         mock_copy.assert_called()
         assert "My_Recording_vocab.mp3" in path
 
 
+def test_save_audio_file_hard_links(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source = tmp_path / "vocab_practice.mp3"
+    source.write_bytes(b"first take")
+
+    path = save_audio_file(str(source), "Lesson 1", "vocab")
+    assert os.path.samefile(path, source)
+
+    # Regenerating replaces the temp file, so the saved recording keeps its audio
+    with patch('logic._ffmpeg_concat', return_value=False):
+        logic.concat_mp3_files([], str(source))
+    assert source.read_bytes() == b""
+    with open(path, "rb") as f:
+        assert f.read() == b"first take"
+
+def test_save_audio_file_sanitizes_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source = tmp_path / "passage_reading.mp3"
+    source.write_bytes(b"audio")
+
+    # Unicode letters and digits are kept; separators and path characters become '_'
+    path = save_audio_file(str(source), "課文 1: Día/..", "passage")
+    assert os.path.basename(path) == "課文_1__Día_passage.mp3"
+    assert os.path.dirname(path) == os.path.join(str(tmp_path), "recordings")
+
+    # A name with nothing usable still gets a filename
+    path = save_audio_file(str(source), "../", "vocab")
+    assert os.path.basename(path) == "recording_vocab.mp3"
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="needs os.copy_file_range")
+def test_save_audio_file_clones_when_link_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source = tmp_path / "vocab_practice.mp3"
+    source.write_bytes(b"audio" * 1000)
+
+    with patch('os.link', side_effect=OSError("cross-device link")), \
+         patch('shutil.copy2') as mock_copy:
+        path = save_audio_file(str(source), "Lesson 1", "vocab")
+
+    mock_copy.assert_not_called()
+    assert not os.path.samefile(path, source)
+    with open(path, "rb") as f:
+        assert f.read() == b"audio" * 1000
+
 @pytest.mark.asyncio
 async def test_process_passage():
-    with patch('logic.generate_speech_bytes', new_callable=AsyncMock) as mock_gen:
-        mock_gen.return_value = b'fake_mp3_bytes'
-        
-        with patch('pydub.AudioSegment.from_file') as mock_from_file, \
-             patch('pydub.AudioSegment.empty') as mock_empty, \
-             patch('pydub.AudioSegment.silent') as mock_silent:
-             
-            mock_audio = MagicMock()
-            mock_from_file.return_value = mock_audio
-            mock_empty.return_value = MagicMock()
-            mock_silent.return_value = MagicMock()
-            
-            mock_audio.__add__.return_value = mock_audio
-            mock_empty.return_value.__add__.return_value = mock_empty.return_value
-
-            # Test with Chinese language and voice
-            path = await process_passage("你好。世界。", "+0%", sentence_repeats=2, language="zh-tw", voice="zh-TW-HsiaoChenNeural", provider="edge")
-            
-            # Should be called twice (once for each sentence)
-            assert mock_gen.call_count == 2
-            # Verify voice was passed
-            mock_gen.assert_called_with("世界 句號", "+0%", voice="zh-TW-HsiaoChenNeural", provider="edge") # Check last call
-            assert path is not None
-            assert "passage_reading.mp3" in path
+    with patch('logic.generate_speech_to_file', new=fake_speech_to_file()) as mock_gen, \
+         patch('logic.encode_silence', side_effect=lambda ms: f'<{ms}>'.encode()):
+
+        # Test with Chinese language and voice
+        path = await process_passage("你好。世界。", "+0%", sentence_repeats=2, language="zh-tw", voice="zh-TW-HsiaoChenNeural", provider="edge")
+
+        # Should be called twice (once for each sentence)
+        assert mock_gen.call_count == 2
+        # Verify voice was passed
+        mock_gen.assert_called_with("世界 句號", "+0%", ANY, voice="zh-TW-HsiaoChenNeural", provider="edge") # Check last call
+        assert path is not None
+        assert "passage_reading.mp3" in path
+        # Each sentence is repeated with the repeat pause between and the sentence pause after
+        with open(path, "rb") as f:
+            expected = "你好 句號<1000>你好 句號<2000>世界 句號<1000>世界 句號<2000>".encode()
+            assert f.read() == expected
+
+        # A pre-split sentence list produces the same audio
+        path = await process_passage(["你好。", "世界。"], "+0%", sentence_repeats=2, language="zh-tw", voice="zh-TW-HsiaoChenNeural", provider="edge")
+        with open(path, "rb") as f:
+            assert f.read() == expected
+
+@pytest.mark.asyncio
+async def test_process_vocabulary_reuses_cached_clips():
+    with patch('logic.generate_speech_to_file', new=fake_speech_to_file(b'fake_mp3_bytes')) as mock_gen, \
+         patch('logic.encode_silence', return_value=b''):
+
+        await process_vocabulary(["apple", "pear"], "+0%", voice="en-US-AriaNeural")
+        assert mock_gen.call_count == 2
+
+        # Only the edited word should be synthesized again
+        await process_vocabulary(["apple", "plum"], "+0%", voice="en-US-AriaNeural")
+        assert mock_gen.call_count == 3
+        mock_gen.assert_called_with("plum", "+0%", ANY, voice="en-US-AriaNeural", provider="edge")
+
+        # A different rate is a different clip
+        await process_vocabulary(["apple"], "-20%", voice="en-US-AriaNeural")
+        assert mock_gen.call_count == 4
+
+@pytest.mark.asyncio
+async def test_synthesize_to_cache_shares_inflight_clip():
+    with patch('logic.generate_speech_to_file', new=fake_speech_to_file()) as mock_gen:
+        # A caller that gives up does not cancel the clip for the one still waiting
+        first = asyncio.ensure_future(logic.synthesize_to_cache("apple", "+0%"))
+        second = asyncio.ensure_future(logic.synthesize_to_cache("apple", "+0%"))
+        await asyncio.sleep(0)
+        first.cancel()
+        path = await second
+
+    assert mock_gen.call_count == 1
+    with open(path, "rb") as f:
+        assert f.read() == b"apple"
+    assert logic._pending_clips == {}
+
+
+@pytest.mark.asyncio
+async def test_process_audio_generation_runs_concurrently():
+    started = []
+
+    def fake_job(name):
+        async def job(*args, **kwargs):
+            started.append(name)
+            # Neither job can finish until both have started
+            while len(started) < 2:
+                await asyncio.sleep(0)
+            return f"{name}.mp3"
+        return AsyncMock(side_effect=job)
+
+    with patch('logic.process_vocabulary', new=fake_job("vocab")), \
+         patch('logic.process_passage', new=fake_job("passage")):
+        paths = await asyncio.wait_for(logic.process_audio_generation(
+            ["word"], "Hi.", "+0%", "+0%", 1, 1, 1, 1.0, 1.0, False, "en", "en-US-AriaNeural", "edge"), timeout=5)
+    assert paths == ("vocab.mp3", "passage.mp3")
+
+    # A missing section is skipped
+    with patch('logic.process_passage', new=AsyncMock(return_value="passage.mp3")):
+        paths = await logic.process_audio_generation(
+            [], "Hi.", "+0%", "+0%", 1, 1, 1, 1.0, 1.0, False, "en", "en-US-AriaNeural", "edge")
+    assert paths == (None, "passage.mp3")
+
+@pytest.mark.asyncio
+async def test_generate_conversation_audio_keeps_turn_order():
+    from pydub import AudioSegment
+
+    async def fake_speech(text, rate, path, voice, provider):
+        if text == "boom":
+            raise Exception("TTS down")
+        # Later turns finish first, so ordering must not depend on completion order
+        await asyncio.sleep(0.01 * (3 - len(text)))
+        with open(path, "wb") as f:
+            f.write(text.encode())
+        return path
+
+    decoded = {b"a": AudioSegment.silent(duration=100), b"bb": AudioSegment.silent(duration=200)}
+    segments = [{"speaker_id": 1, "text": "a"}, {"speaker_id": 2, "text": "boom"}, {"speaker_id": 2, "text": ""}, {"speaker_id": 1, "text": "bb"}]
+    with patch('logic.generate_speech_to_file', new=AsyncMock(side_effect=fake_speech)) as mock_gen, \
+         patch('pydub.AudioSegment.from_file', side_effect=lambda f, format: decoded[f.getvalue()]), \
+         patch('pydub.AudioSegment.export', autospec=True) as mock_export, \
+         patch('logic.audio_process_pool', return_value=None):  # default thread pool, so the patches above apply
+        path = await logic.generate_conversation_audio(segments, language_code="en-US")
+
+    assert path.endswith("conversation_output.mp3")
+    # Empty turns are skipped; speakers map to distinct voices
+    assert [c.kwargs["voice"] for c in mock_gen.call_args_list] == ["en-US-AriaNeural", "en-US-GuyNeural", "en-US-AriaNeural"]
+    # The failed turn is dropped; each remaining turn is followed by a 300ms pause
+    combined = mock_export.call_args.args[0]
+    assert len(combined) == 100 + 300 + 200 + 300
+    # Encoded as mono speech at the tuned bitrate rather than pydub's defaults
+    assert combined.channels == 1
+    assert mock_export.call_args.kwargs["bitrate"] == logic.SPEECH_EXPORT_BITRATE
+
+@pytest.mark.asyncio
+async def test_cached_speech_bytes():
+    with patch('logic.generate_speech_to_file', new=fake_speech_to_file(b'mp3')) as mock_gen:
+        assert await logic.cached_speech_bytes("hi", "+0%", voice="en-US-AriaNeural") == b'mp3'
+        assert mock_gen.call_count == 1
+
+        # Served from memory without touching the disk cache
+        with patch('logic.cached_preview') as mock_lookup:
+            assert await logic.cached_speech_bytes("hi", "+0%", voice="en-US-AriaNeural") == b'mp3'
+        mock_lookup.assert_not_called()
+
+        # After a restart (empty memory cache) the clip still comes from disk
+        logic._speech_memory_cache.clear()
+        assert await logic.cached_speech_bytes("hi", "+0%", voice="en-US-AriaNeural") == b'mp3'
+        assert mock_gen.call_count == 1
+
+        # The provider is part of the key
+        await logic.cached_speech_bytes("hi", "+0%", voice="en-US-AriaNeural", provider="google")
+        assert mock_gen.call_count == 2
+
+def test_join_audio_segments():
+    from pydub import AudioSegment
+
+    mono = AudioSegment.silent(duration=100, frame_rate=24000)
+    stereo = AudioSegment.silent(duration=200, frame_rate=48000).set_channels(2)
+    joined = logic.join_audio_segments([mono, stereo, mono])
+    assert len(joined) == 400
+    # Mixed inputs are brought to a common format before joining
+    assert (joined.frame_rate, joined.channels) == (48000, 2)
+    assert len(logic.join_audio_segments([])) == 0
+
+def test_mp3_stream_format(tmp_path):
+    # MPEG-2 Layer III frame header: 24 kHz mono / 22.05 kHz stereo
+    mono_24k = tmp_path / "a.mp3"
+    mono_24k.write_bytes(b"ID3\x04\x00\x00\x00\x00\x00\x02xx" + b"\xff\xf3\x64\xc0" + b"\x00" * 16)
+    stereo_22k = tmp_path / "b.mp3"
+    stereo_22k.write_bytes(b"\xff\xf3\x60\x00" + b"\x00" * 16)
+    junk = tmp_path / "c.mp3"
+    junk.write_bytes(b"not audio")
+
+    assert logic.mp3_stream_format(str(mono_24k)) == (24000, 1)
+    assert logic.mp3_stream_format(str(stereo_22k)) == (22050, 2)
+    assert logic.mp3_stream_format(str(junk)) is None
+
+    # Mixed formats cannot be spliced frame by frame, so they are re-encoded
+    with patch('logic._pydub_concat') as mock_pydub, patch('logic._ffmpeg_concat') as mock_ffmpeg:
+        logic.concat_mp3_files([str(mono_24k), str(stereo_22k)], str(tmp_path / "out.mp3"))
+        assert mock_pydub.call_count == 1
+        mock_ffmpeg.assert_not_called()
+
+        logic.concat_mp3_files([str(mono_24k), str(junk), str(mono_24k)], str(tmp_path / "out.mp3"))
+        assert mock_pydub.call_count == 1
+        assert mock_ffmpeg.call_count == 1
+
+@pytest.mark.asyncio
+async def test_google_tts_reuses_session(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "key")
+    response = MagicMock(status=200)
+    response.read = AsyncMock(return_value=b'{"audioContent": "bXAz"}')
+    session = MagicMock()
+    session.post.return_value.__aenter__.return_value = response
+
+    with patch('logic.google_tts_session', new=AsyncMock(return_value=session)):
+        assert await logic.generate_speech_bytes("hi", "+0%", voice="en-US-Standard-A", provider="google") == b"mp3"
+        await logic.generate_speech_bytes("bye", "+0%", voice="en-US-Standard-A", provider="google")
+    assert session.post.call_count == 2
+    request = logic._json_loads(session.post.call_args.kwargs["data"])
+    assert request["input"] == {"text": "bye"}
+    assert request["voice"] == {"languageCode": "en-US", "name": "en-US-Standard-A"}
+
+    # Same result with the stdlib json fallback when orjson is not installed
+    with patch('logic.google_tts_session', new=AsyncMock(return_value=session)), patch('logic.orjson', None):
+        assert await logic.generate_speech_bytes("hi", "+0%", voice="en-US-Standard-A", provider="google") == b"mp3"
+
+    # The session itself is created once per event loop and shared
+    shared = await logic.google_tts_session()
+    assert await logic.google_tts_session() is shared
+    await shared.close()
+    assert await logic.google_tts_session() is not shared
+    await (await logic.google_tts_session()).close()
+
+def test_google_tts_session_closed_with_its_loop():
+    async def open_session():
+        return await logic.google_tts_session()
+
+    session = asyncio.run(open_session())
+    assert session.closed
+    assert logic._google_http_sessions == {}
+
+def test_google_tts_session_survives_gc():
+    async def use_session_after_gc():
+        session = await logic.google_tts_session()
+        # The loop only holds weak references to tasks; the shutdown watcher must outlive a collection
+        gc.collect()
+        await asyncio.sleep(0)
+        assert not session.closed
+        assert logic._google_http_sessions[asyncio.get_running_loop()][0] is session
+        return session
+
+    assert asyncio.run(use_session_after_gc()).closed
+
+def test_rate_to_speaking_rate():
+    assert logic._rate_to_speaking_rate("-20%") == pytest.approx(0.8)
+    assert logic._rate_to_speaking_rate("+50%") == pytest.approx(1.5)
+    # Clamped to Google's accepted range
+    assert logic._rate_to_speaking_rate("-90%") == 0.25
+    # Unparseable rates fall back to normal speed
+    assert logic._rate_to_speaking_rate("fast%") == 1.0
+    assert logic._rate_to_speaking_rate(None) == 1.0
+
+def test_prune_preview_cache_keeps_silence(tmp_path):
+    with patch('logic.encode_silence', return_value=b'<silence>'):
+        silence = logic.silence_clip_path(2000)
+    # Older than every clip, so it would be first in line for LRU pruning
+    os.utime(silence, (0, 0))
+    cache_dir = os.path.dirname(silence)
+    for i in range(5):
+        with open(os.path.join(cache_dir, f"clip{i}.mp3"), "wb") as f:
+            f.write(b"mp3")
+
+    logic.prune_preview_cache(max_files=2)
+
+    assert os.path.exists(silence)
+    assert len([n for n in os.listdir(cache_dir) if n.startswith("clip")]) == 2
+
+def test_audio_process_pool_round_trips_pcm(tmp_path):
+    from pydub import AudioSegment
+
+    segment = AudioSegment.silent(duration=250, frame_rate=24000)
+    pool = logic.audio_process_pool()
+    assert pool._mp_context.get_start_method() == "spawn"
+
+    # Audio crosses the process boundary in both directions unchanged
+    pcm = pool.submit(logic._segment_to_pcm, segment).result(timeout=60)
+    assert pcm == (segment.raw_data, 2, 24000, 1)
+    rebuilt = pool.submit(logic._segment_from_pcm, *pcm).result(timeout=60)
+    assert rebuilt.raw_data == segment.raw_data
+    assert (rebuilt.frame_rate, rebuilt.channels, len(rebuilt)) == (24000, 1, 250)
+
+    if shutil.which("ffmpeg"):
+        path = str(tmp_path / "out.mp3")
+        assert pool.submit(logic._export_mp3, *pcm, path).result(timeout=60) == path
+        assert os.path.getsize(path) > 0
+
+def test_generate_content_with_retry():
+    from google.api_core import exceptions as google_exceptions
+
+    model = MagicMock()
+    model.generate_content.side_effect = [
+        google_exceptions.ResourceExhausted("quota"),
+        google_exceptions.ServiceUnavailable("overloaded"),
+        "response",
+    ]
+    with patch('time.sleep') as mock_sleep:
+        assert generate_content_with_retry(model, ["prompt"]) == "response"
+    assert model.generate_content.call_count == 3
+    # Exponential backoff between attempts
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [1, 2]
+
+    # Non-transient errors are not retried
+    model = MagicMock()
+    model.generate_content.side_effect = google_exceptions.InvalidArgument("bad image")
+    with patch('time.sleep') as mock_sleep, pytest.raises(google_exceptions.InvalidArgument):
+        generate_content_with_retry(model, ["prompt"])
+    assert model.generate_content.call_count == 1
+    mock_sleep.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_process_passage_stream():
+    with patch('logic.generate_speech_to_file', new=fake_speech_to_file()), \
+         patch('logic.encode_silence', side_effect=lambda ms: f'<{ms}>'.encode()):
+
+        blocks = [block async for block in process_passage_stream("Hi. Bye.", "+0%", sentence_repeats=2)]
+
+        # One block per sentence, in passage order, matching the layout of process_passage
+        assert blocks == [
+            (0, b"Hi period<1000>Hi period<2000>"),
+            (1, b"Bye period<1000>Bye period<2000>"),
+        ]
+
+
+def test_extract_text_from_image_requests_json():
+    model = MagicMock()
+    model.generate_content.return_value.text = '{"vocabulary": ["cat"], "passage": "", "language": "en"}'
+
+    result = logic.extract_text_from_image(b"jpeg", "image/jpeg", model=model)
+
+    assert result == {"vocabulary": ["cat"], "passage": "", "language": "en"}
+    config = model.generate_content.call_args.kwargs["generation_config"]
+    assert config["response_mime_type"] == "application/json"
+    assert config["response_schema"]["required"] == ["vocabulary", "passage", "language"]
+
+def test_prepare_image_for_extraction():
+    import io
+    from PIL import Image
+
+    def encode(size, fmt):
+        buf = io.BytesIO()
+        Image.new("RGB", size, "white").save(buf, format=fmt)
+        return buf.getvalue()
+
+    # Small images are sent untouched
+    small = encode((800, 600), "PNG")
+    assert prepare_image_for_extraction(small, "image/png") == (small, "image/png")
+
+    # Large photos are downscaled to the size limit and re-encoded as JPEG
+    large = encode((4000, 3000), "PNG")
+    payload, mime_type = prepare_image_for_extraction(large, "image/png")
+    assert mime_type == "image/jpeg"
+    assert Image.open(io.BytesIO(payload)).size == (1600, 1200)
+
+    # Undecodable input falls back to the original bytes
+    assert prepare_image_for_extraction(b"not an image", "image/jpeg") == (b"not an image", "image/jpeg")